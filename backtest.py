@@ -2,7 +2,7 @@ import pandas as pd
 
 
 class Backtest:
-    def __init__(self, data, strategy, initial_cash=10000):
+    def __init__(self, data, strategy, initial_cash=10000, live_metrics=None):
         """
         Init of Backtest, backtest a strategy given data and strategy
 
@@ -12,10 +12,12 @@ class Backtest:
             - 'High': float, the high price of the asset
             - 'Low': float, the low price of the asset
             - 'Volume': float, the trading volume
+        live_metrics (StreamingMetrics): optional, updated every bar and every trade during the run
         """
         self.data = data
         self.strategy = strategy
         self.initial_cash = initial_cash
+        self.live_metrics = live_metrics
         self.trade_history = []
         self.trade_history_df = []
 
@@ -67,6 +69,8 @@ class Backtest:
                     'value': shares * price,
                     'reason': 'BUY MA CROSSOVER'
                 })
+                if self.live_metrics is not None:
+                    self.live_metrics.update_trade(self.trade_history[-1])
                 
             elif signal == -1:  # Sell
                 # Record exit
@@ -76,7 +80,7 @@ class Backtest:
                     reason = 'TAKE PROFIT'
                 elif signals['stop_loss'].iloc[i] == 1:
                     reason = 'STOP LOSS'
-                elif signals['bearish'].iloc[i] == 1:
+                elif 'bearish' in signals and signals['bearish'].iloc[i] == 1:
                     reason = 'BEARISH'
                 
                 self.trade_history.append({
@@ -89,6 +93,8 @@ class Backtest:
                     'profit_loss_pct': (price / entry_price - 1) * 100 if entry_price > 0 else 0,
                     'reason': reason
                 })
+                if self.live_metrics is not None:
+                    self.live_metrics.update_trade(self.trade_history[-1])
                 
                 cash += shares * price
                 shares = 0
@@ -99,6 +105,9 @@ class Backtest:
             portfolio.at[portfolio.index[i], "holdings"] = holdings
             portfolio.at[portfolio.index[i], "portfolio_value"] = cash + holdings
 
+            if self.live_metrics is not None:
+                self.live_metrics.update(cash + holdings)
+
         # Convert trade history to DataFrame
         if self.trade_history:
             self.trade_history_df = pd.DataFrame(self.trade_history)
@@ -1,7 +1,11 @@
-import yfinance as yf
+from ingest import DataStore, update_symbols
 
-ticker = 'AAPL'
+tickers = ['AAPL']
 
-data = yf.download(ticker, start='2010-01-01', end='2025-01-01')
+# Only the bars missing from data/store are downloaded
+store = DataStore('data/store')
+added = update_symbols(tickers, store=store, start='2010-01-01', end='2025-01-01')
+print(added)
 
-data.to_csv('data/aapl.csv')
\ No newline at end of file
+# csv for main.py
+store.load('AAPL').to_csv('data/aapl.csv')
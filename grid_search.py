@@ -4,19 +4,24 @@ import itertools
 from joblib import Parallel, delayed
 from tqdm import tqdm
 from strategies.strategy1 import Strategy
+from strategies.rule_strategy import RuleStrategy
 from backtest import Backtest
 from metrics import PerformanceMetrics
 import time
 
-def run_single_backtest(params, data, param_keys):
-    """Run a single backtest with the given parameters"""
+# Order of the parameters in a combination, same as the __main__ grid
+PARAM_KEYS = ['short_window', 'long_window', 'adx_threshold', 'trend_direction_threshold', 'stop_loss_pct',
+              'take_profit_pct', 'enter_trade_threshold', 'exit_trade_threshold', 'volume_ma_period', 'volume_threshold']
+
+def build_strategy(params):
+    """Strategy for a parameter combination (in the order of PARAM_KEYS), None if invalid"""
     short_window, long_window, adx_threshold, trend_direction_threshold, stop_loss_pct, take_profit_pct, enter_trade_threshold, exit_trade_threshold, volume_ma_period, volume_threshold= params
     
     # Skip invalid combinations (short_window >= long_window)
     if short_window >= long_window:
         return None
     
-    strategy = Strategy(
+    return Strategy(
         short_window=short_window,
         long_window=long_window,
         adx_threshold=adx_threshold,
@@ -28,15 +33,26 @@ def run_single_backtest(params, data, param_keys):
         volume_ma_period=volume_ma_period,
         volume_threshold=volume_threshold
     )
+
+def run_single_backtest(params, data, param_keys):
+    """Run a single backtest with the given parameters"""
+    strategy = build_strategy(params)
+    if strategy is None:
+        return None
     
-    bt = Backtest(data, strategy)
+    # Compiled rules, same signals as strategy.generate_signals but a lot faster
+    bt = Backtest(data, RuleStrategy(strategy.rule_spec()))
     results = bt.run()
     
     metrics = PerformanceMetrics(results=results, trades_df=bt.trade_history_df)
     all_metrics = metrics.all_metrics()
     
+    return summarise_metrics(params, param_keys, all_metrics, has_trades=not bt.trade_history_df.empty)
+
+def summarise_metrics(params, param_keys, all_metrics, has_trades=True):
+    """Result row of a parameter combination, with its composite score"""
     # Check if any trades were made
-    if bt.trade_history_df.empty:
+    if not has_trades:
         param_dict = dict(zip(param_keys, params))
         param_dict.update({
             'total_return': 0,
@@ -200,7 +216,7 @@ if __name__ == "__main__":
             take_profit_pct=best_params['take_profit_pct']
         )
         
-        test_bt = Backtest(test_data, best_strategy)
+        test_bt = Backtest(test_data, RuleStrategy(best_strategy.rule_spec()))
         test_results = test_bt.run()
         test_metrics = PerformanceMetrics(results=test_results, trades_df=test_bt.trade_history_df)
         test_all_metrics = test_metrics.all_metrics()
@@ -0,0 +1,254 @@
+"""
+Incremental grid search.
+
+The first run keeps the end state of every parameter combination (position, entry price, cash, shares
+and the streaming metrics) and the last bars of the data needed by the rolling windows.
+When new bars arrive only the new bars are run for every combination and the leaderboard is updated,
+instead of running grid_search() again from the first bar.
+"""
+import copy
+import itertools
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from tqdm import tqdm
+
+from backtest import Backtest
+from grid_search import build_strategy, summarise_metrics
+from rules import RuleCache
+from strategies.rule_strategy import RuleStrategy
+from streaming_metrics import StreamingMetrics
+
+# Bars needed before a bar to compute its ADX (14 bar window of DX, which uses 14 bar sums of diffs)
+ADX_LOOKBACK = 2 * 14 + 1
+
+
+def start_combination(params, data, risk_free_rate=0.01):
+    """
+    Full backtest of a combination
+
+    Returns:
+    dict: end state of the combination, None if the combination is invalid
+    """
+    strategy = build_strategy(params)
+    if strategy is None:
+        return None
+
+    live_metrics = StreamingMetrics(risk_free_rate)
+    bt = Backtest(data, RuleStrategy(strategy.rule_spec()), live_metrics=live_metrics)
+    results = bt.run()
+
+    # The position is open if the last signal was a buy
+    signal = results["signal"].to_numpy()
+    traded = np.flatnonzero(signal)
+    in_position = len(traded) > 0 and signal[traded[-1]] == 1
+
+    return {
+        'params': params,
+        'in_position': bool(in_position),
+        'entry_price': float(results["price"].iloc[traded[-1]]) if in_position else 0,
+        'cash': float(results["cash"].iloc[-1]),
+        'shares': float(results["position"].iloc[-1]),
+        'metrics': live_metrics
+    }
+
+
+def advance_combination(state, frame, new_bars, cache=None):
+    """
+    Run a combination over the new bars only
+
+    Parameters:
+    state : end state from start_combination or a previous advance_combination
+    frame : last bars of the previous data (enough for the rolling windows) followed by the new bars
+    new_bars : number of new bars at the end of frame
+    cache : optional rules.RuleCache of frame, to share the indicators between the combinations
+
+    Returns:
+    dict: the new end state, the given state is not modified
+    """
+    strategy = build_strategy(state['params'])
+    start = len(frame) - new_bars
+    signals = RuleStrategy(strategy.rule_spec()).compiled.run(
+        frame, start=start, in_position=state['in_position'], entry_price=state['entry_price'], cache=cache
+    ).iloc[start:]
+
+    # Work on copies so the previous state is untouched if a combination fails part way
+    state = dict(state)
+    cash = state['cash']
+    shares = state['shares']
+    entry_price = state['entry_price']
+    metrics = copy.deepcopy(state['metrics'])
+
+    # Same bookkeeping as Backtest.run
+    for date, price, signal, stop_loss, take_profit, bearish in zip(
+        signals.index, signals["price"].tolist(), signals["signal"].tolist(), signals["stop_loss"].tolist(),
+        signals["take_profit"].tolist(), signals["bearish"].tolist()
+    ):
+        if signal == 1:
+            entry_price = price
+            shares = cash // price
+            cash -= shares * price
+            metrics.update_trade({
+                'type': 'BUY',
+                'date': date,
+                'price': price,
+                'shares': shares,
+                'value': shares * price,
+                'reason': 'BUY MA CROSSOVER'
+            })
+            state['in_position'] = True
+
+        elif signal == -1:
+            reason = 'SELL MA CROSSOVER'
+            if take_profit == 1:
+                reason = 'TAKE PROFIT'
+            elif stop_loss == 1:
+                reason = 'STOP LOSS'
+            elif bearish == 1:
+                reason = 'BEARISH'
+
+            metrics.update_trade({
+                'type': 'SELL',
+                'date': date,
+                'price': price,
+                'shares': shares,
+                'value': shares * price,
+                'profit_loss': shares * (price - entry_price),
+                'profit_loss_pct': (price / entry_price - 1) * 100 if entry_price > 0 else 0,
+                'reason': reason
+            })
+            cash += shares * price
+            shares = 0
+            state['in_position'] = False
+
+        metrics.update(cash + shares * price)
+
+    state.update({'cash': cash, 'shares': shares, 'entry_price': entry_price, 'metrics': metrics})
+    return state
+
+
+def advance_combinations(states, frame, new_bars, cache):
+    """advance_combination for a batch of states, sharing the cache"""
+    return [advance_combination(state, frame, new_bars, cache) for state in states]
+
+
+class IncrementalGridSearch:
+    def __init__(self, param_grid, risk_free_rate=0.01):
+        """
+        Grid search that can be updated with new bars
+
+        Parameters:
+        param_grid : Dictionary of parameter ranges to search, same keys and order as in grid_search.py
+        risk_free_rate : yearly risk free rate for the Sharpe ratio
+        """
+        self.param_keys = list(param_grid.keys())
+        self.param_combinations = list(itertools.product(*param_grid.values()))
+        self.risk_free_rate = risk_free_rate
+
+        # Bars kept from the previous data so the rolling windows of the new bars are complete
+        # (the moving average signal uses the previous bar)
+        self.lookback = max(
+            max(param_grid.get('long_window', [0])) + 1,
+            max(param_grid.get('volume_ma_period', [0])) + 1,
+            ADX_LOOKBACK
+        )
+
+        self.states = []
+        self.tail = None
+        self.last_date = None
+
+    def fit(self, data, use_parallel=True, n_jobs=-1):
+        """
+        Run every combination on data and keep their end states
+
+        Returns:
+        pd.DataFrame: Results of the grid search, sorted by composite score
+        """
+        print(f"Running grid search with {len(self.param_combinations)} parameter combinations...")
+        start_time = time.time()
+
+        if use_parallel:
+            states = Parallel(n_jobs=n_jobs)(
+                delayed(start_combination)(params, data, self.risk_free_rate)
+                for params in tqdm(self.param_combinations, desc="Testing Parameters")
+            )
+        else:
+            states = [start_combination(params, data, self.risk_free_rate)
+                      for params in tqdm(self.param_combinations, desc="Testing Parameters")]
+
+        self.states = [state for state in states if state is not None]
+        self.tail = data.iloc[-self.lookback:]
+        self.last_date = data.index[-1]
+
+        print(f"Grid search completed in {time.time() - start_time:.2f} seconds")
+        return self.leaderboard()
+
+    def update(self, data, use_parallel=True, n_jobs=-1):
+        """
+        Run every combination over the bars of data after the last bar seen
+
+        Parameters:
+        data : the extended data (or only the new bars)
+
+        Returns:
+        pd.DataFrame: Updated results, sorted by composite score
+        """
+        if self.last_date is None:
+            return self.fit(data, use_parallel, n_jobs)
+
+        new_data = data[data.index > self.last_date]
+        if new_data.empty:
+            return self.leaderboard()
+
+        frame = pd.concat([self.tail, new_data])
+        new_bars = len(new_data)
+        print(f"Updating {len(self.states)} parameter combinations with {new_bars} new bars...")
+        start_time = time.time()
+
+        # Every combination runs on the same frame so the indicators are only computed once
+        cache = RuleCache(frame)
+        if use_parallel:
+            # The cache is copied to every task, one batch of combinations per worker keeps it shared
+            n_batches = min(effective_n_jobs(n_jobs), len(self.states))
+            size = -(-len(self.states) // n_batches) if n_batches > 0 else 1
+            batches = [self.states[i:i + size] for i in range(0, len(self.states), size)]
+            results = Parallel(n_jobs=n_jobs)(
+                delayed(advance_combinations)(batch, frame, new_bars, cache)
+                for batch in tqdm(batches, desc="Updating Parameters")
+            )
+            self.states = [state for batch in results for state in batch]
+        else:
+            self.states = [advance_combination(state, frame, new_bars, cache)
+                           for state in tqdm(self.states, desc="Updating Parameters")]
+
+        self.tail = frame.iloc[-self.lookback:]
+        self.last_date = frame.index[-1]
+
+        print(f"Update completed in {time.time() - start_time:.2f} seconds")
+        return self.leaderboard()
+
+    def leaderboard(self):
+        """Results of every combination from their end states, sorted by composite score"""
+        results = [
+            summarise_metrics(state['params'], self.param_keys, state['metrics'].all_metrics(),
+                              has_trades=state['metrics'].trades.total_trades > 0)
+            for state in self.states
+        ]
+        results_df = pd.DataFrame(results)
+
+        if results_df.empty:
+            return pd.DataFrame()
+
+        return results_df.sort_values('composite_score', ascending=False)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
@@ -0,0 +1,254 @@
+"""
+Incremental multi-ticker data ingestion.
+
+Every symbol is stored column by column (one raw binary file per column) so new bars are appended
+at the end of the files without rewriting them. A small index.json keeps the last bar of every symbol,
+only the missing dates are downloaded and the symbols are fetched concurrently.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['Close', 'High', 'Low', 'Open', 'Volume']
+# Corporate actions, when a provider gives them a split or a dividend in new bars changes the adjusted past prices
+ACTION_COLUMNS = ['Dividends', 'Stock Splits']
+
+
+class YFinanceProvider:
+    def fetch(self, symbol, start, end):
+        """
+        Download daily bars from yfinance
+
+        Parameters:
+        symbol : ticker, e.g. 'AAPL'
+        start : first date (included)
+        end : last date (excluded), None for today
+
+        Returns:
+        pd.DataFrame: Date index, the columns 'Close', 'High', 'Low', 'Open', 'Volume' (split and dividend
+                      adjusted) and 'Dividends', 'Stock Splits', None if no data
+        """
+        import yfinance as yf
+
+        # yf.download shares module level state between calls, a Ticker per call is safe in the threads
+        data = yf.Ticker(symbol).history(start=start, end=end, auto_adjust=True, actions=True)
+        if data.empty:
+            return None
+        return normalise(data)
+
+
+class CSVProvider:
+    def __init__(self, directory):
+        """
+        Provider reading <directory>/<symbol>.csv files (lower case symbol), to use local data or in tests
+
+        Parameters:
+        directory : folder with the csv files
+        """
+        self.directory = directory
+
+    def fetch(self, symbol, start, end):
+        path = os.path.join(self.directory, f"{symbol.lower()}.csv")
+        data = normalise(pd.read_csv(path, index_col="Date", parse_dates=True))
+        data = data[data.index >= pd.Timestamp(start)]
+        if end is not None:
+            data = data[data.index < pd.Timestamp(end)]
+        return data
+
+
+def normalise(data):
+    """
+    Keep the columns of the store (and the corporate actions if any), flatten the (Price, Ticker) columns
+    from yfinance and remove the timezone so every provider gives the same layout
+    """
+    if isinstance(data.columns, pd.MultiIndex):
+        data = data.copy()
+        data.columns = data.columns.get_level_values(0)
+    data = data[COLUMNS + [c for c in ACTION_COLUMNS if c in data.columns]].astype(float)
+    index = pd.DatetimeIndex(data.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    data.index = index.rename("Date")
+    return data.sort_index()
+
+
+class DataStore:
+    def __init__(self, directory="data/store"):
+        """
+        Append only columnar store, one folder per symbol and index.json with the last bar of every symbol
+
+        Parameters:
+        directory : folder of the store, default data/store
+        """
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        # Symbols are appended from several threads, they all share the index
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+    def symbols(self):
+        return sorted(self.index)
+
+    def first_date(self, symbol):
+        if symbol not in self.index:
+            return None
+        first = np.fromfile(self._path(symbol, 'Date'), dtype=np.int64, count=1)
+        return pd.Timestamp(first[0])
+
+    def last_date(self, symbol):
+        entry = self.index.get(symbol)
+        return pd.Timestamp(entry['last_date']) if entry else None
+
+    def rows(self, symbol):
+        return self.index.get(symbol, {}).get('rows', 0)
+
+    def _path(self, symbol, column):
+        return os.path.join(self.directory, symbol, f"{column}.bin")
+
+    def append(self, symbol, data):
+        """
+        Append the bars after the last stored bar and update the index in memory,
+        save_index writes it to disk
+
+        Parameters:
+        symbol : ticker
+        data : bars with a Date index and the store columns
+
+        Returns:
+        dict: the new index entry of the symbol, None if there was nothing new
+        """
+        data = normalise(data)
+        last = self.last_date(symbol)
+        if last is not None:
+            data = data[data.index > last]
+        data = data[~data.index.duplicated(keep='last')]
+        if data.empty:
+            return None
+
+        rows = self.rows(symbol)
+        os.makedirs(os.path.join(self.directory, symbol), exist_ok=True)
+
+        arrays = {'Date': data.index.values.astype('datetime64[ns]').astype(np.int64)}
+        arrays.update({column: data[column].to_numpy(dtype=np.float64) for column in COLUMNS})
+        for column, values in arrays.items():
+            path = self._path(symbol, column)
+            # Drop anything written after the last indexed row (an interrupted append)
+            if os.path.exists(path):
+                os.truncate(path, rows * 8)
+            with open(path, "ab") as f:
+                f.write(values.tobytes())
+
+        entry = {'last_date': data.index[-1].strftime("%Y-%m-%d"), 'rows': rows + len(data)}
+        with self._lock:
+            self.index[symbol] = entry
+        return entry
+
+    def replace(self, symbol, data):
+        """
+        Rewrite the whole history of a symbol (e.g. when the adjusted prices changed)
+
+        Returns:
+        dict: the new index entry of the symbol
+        """
+        with self._lock:
+            self.index.pop(symbol, None)
+        return self.append(symbol, data)
+
+    def save_index(self):
+        # Write then rename so the index is never half written
+        tmp_path = self.index_path + ".tmp"
+        with self._lock:
+            index = dict(self.index)
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+    def load(self, symbol, start=None, end=None):
+        """
+        Read the bars of a symbol
+
+        Returns:
+        pd.DataFrame: Date index and the columns 'Close', 'High', 'Low', 'Open', 'Volume', like the csv files
+        """
+        rows = self.index[symbol]['rows']
+        dates = np.fromfile(self._path(symbol, 'Date'), dtype=np.int64, count=rows)
+        data = pd.DataFrame(
+            {column: np.fromfile(self._path(symbol, column), dtype=np.float64, count=rows) for column in COLUMNS},
+            index=pd.DatetimeIndex(dates.astype('datetime64[ns]'), name="Date")
+        )
+        if start is not None:
+            data = data[data.index >= pd.Timestamp(start)]
+        if end is not None:
+            data = data[data.index < pd.Timestamp(end)]
+        return data
+
+
+def has_actions(data):
+    """True if the bars have a split or a dividend"""
+    return any((data[column].fillna(0) != 0).any() for column in ACTION_COLUMNS if column in data.columns)
+
+
+def update_symbols(symbols, provider=None, store=None, start='2010-01-01', end=None, max_workers=8):
+    """
+    Fetch only the missing bars of every symbol (concurrently) and append them to the store.
+    If the new bars have a split or a dividend (providers giving the corporate actions), the stored
+    adjusted prices are out of date so the history of the symbol is downloaded again
+
+    Parameters:
+    symbols : list of tickers
+    provider : object with fetch(symbol, start, end), default YFinanceProvider
+    store : DataStore, default DataStore()
+    start : first date for the symbols not in the store yet
+    end : last date (excluded), None for up to yesterday (today's bar is not final yet
+          and a stored bar is never updated)
+    max_workers : number of threads
+
+    Returns:
+    dict: number of new bars per symbol (failed symbols are printed and left out)
+    """
+    symbols = list(dict.fromkeys(symbols))  # one thread per symbol
+    provider = provider if provider is not None else YFinanceProvider()
+    store = store if store is not None else DataStore()
+    end_date = pd.Timestamp(end) if end is not None else pd.Timestamp.today().normalize()
+
+    def update(symbol):
+        # Number of new bars of the symbol
+        rows = store.rows(symbol)
+        last = store.last_date(symbol)
+        fetch_start = last + pd.Timedelta(days=1) if last is not None else pd.Timestamp(start)
+        if fetch_start >= end_date:
+            return 0
+        data = provider.fetch(symbol, fetch_start.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"))
+        if data is None or len(data) == 0:
+            return 0
+        if last is not None and has_actions(data):
+            first = store.first_date(symbol).strftime("%Y-%m-%d")
+            history = provider.fetch(symbol, first, end_date.strftime("%Y-%m-%d"))
+            if history is None or len(history) == 0:
+                raise ValueError(f"no history to rebuild {symbol} after a split or dividend")
+            store.replace(symbol, history)
+        else:
+            store.append(symbol, data)
+        return store.rows(symbol) - rows
+
+    added = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(update, symbol): symbol for symbol in symbols}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                added[symbol] = future.result()
+            except Exception as e:
+                print(f"Failed to update {symbol}: {e}")
+
+    store.save_index()
+    return added
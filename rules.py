@@ -0,0 +1,478 @@
+"""
+Declarative strategy rules.
+
+A strategy is described with expressions over indicator columns (col, rolling_mean, shift, comparisons...),
+scored conditions (score / select) and stop loss / take profit exits in a RuleSpec.
+compile_rules turns the spec into a flat program where every shared sub-expression is evaluated once
+with NumPy, and position_kernel walks the bars once to handle the position state.
+"""
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+
+class Expr:
+    def __init__(self, op, children=(), params=()):
+        """
+        Node of a rule expression, build them with col, const, rolling_mean... and the operators
+
+        Parameters:
+        op : name of the operation
+        children : input expressions
+        params : literal parameters of the operation (column name, window, constant...)
+        """
+        self.op = op
+        self.children = tuple(children)
+        self.params = tuple(params)
+        # Structural key, two expressions with the same key compute the same thing
+        self.key = (op, self.params, tuple(child.key for child in self.children))
+
+    def __repr__(self):
+        if self.op == "col":
+            return f"col({self.params[0]!r})"
+        if self.op == "const":
+            return repr(self.params[0])
+        inner = ", ".join([repr(c) for c in self.children] + [repr(p) for p in self.params])
+        return f"{self.op}({inner})"
+
+    # Arithmetic
+    def __add__(self, other):
+        return Expr("add", (self, _wrap(other)))
+
+    def __radd__(self, other):
+        return Expr("add", (_wrap(other), self))
+
+    def __sub__(self, other):
+        return Expr("sub", (self, _wrap(other)))
+
+    def __rsub__(self, other):
+        return Expr("sub", (_wrap(other), self))
+
+    def __mul__(self, other):
+        return Expr("mul", (self, _wrap(other)))
+
+    def __rmul__(self, other):
+        return Expr("mul", (_wrap(other), self))
+
+    def __truediv__(self, other):
+        return Expr("div", (self, _wrap(other)))
+
+    def __rtruediv__(self, other):
+        return Expr("div", (_wrap(other), self))
+
+    # Comparisons, they build expressions so Expr can't be used as a dict key (use .key instead)
+    def __gt__(self, other):
+        return Expr("gt", (self, _wrap(other)))
+
+    def __ge__(self, other):
+        return Expr("ge", (self, _wrap(other)))
+
+    def __lt__(self, other):
+        return Expr("lt", (self, _wrap(other)))
+
+    def __le__(self, other):
+        return Expr("le", (self, _wrap(other)))
+
+    def __eq__(self, other):
+        return Expr("eq", (self, _wrap(other)))
+
+    def __ne__(self, other):
+        return Expr("ne", (self, _wrap(other)))
+
+    __hash__ = None
+
+    # Boolean logic
+    def __and__(self, other):
+        return Expr("and", (self, _wrap(other)))
+
+    def __or__(self, other):
+        return Expr("or", (self, _wrap(other)))
+
+    def __invert__(self):
+        return Expr("not", (self,))
+
+
+def _wrap(value):
+    return value if isinstance(value, Expr) else const(value)
+
+
+def col(name):
+    """Column of the data (or of an indicator frame)"""
+    return Expr("col", params=(name,))
+
+
+def const(value):
+    return Expr("const", params=(value,))
+
+
+def rolling_mean(expr, window):
+    return Expr("rolling_mean", (_wrap(expr),), (window,))
+
+
+def shift(expr, periods=1, fill=np.nan):
+    """Shift the values by periods bars, the first bars are set to fill"""
+    return Expr("shift", (_wrap(expr),), (periods, fill))
+
+
+def isnull(expr):
+    return Expr("isnull", (_wrap(expr),))
+
+
+def where(cond, if_true, if_false):
+    return Expr("where", (_wrap(cond), _wrap(if_true), _wrap(if_false)))
+
+
+def select(*tiers, default=0):
+    """
+    Tiered score, the points of the first condition that is true (or default)
+
+    Parameters:
+    tiers : (condition, points) pairs in priority order
+    default : points when no condition is true
+    """
+    children = []
+    for cond, points in tiers:
+        children += [_wrap(cond), _wrap(points)]
+    children.append(_wrap(default))
+    return Expr("select", children)
+
+
+def score(cond, points):
+    """points when cond is true, else 0"""
+    return select((cond, points))
+
+
+class RuleSpec:
+    def __init__(self, entry, entry_threshold, exits=(), exit_threshold=None, stop_loss_pct=None,
+                 take_profit_pct=None, stop_loss_points=4, take_profit_points=3, exit_reasons=(),
+                 columns=(), entry_columns=(), indicators=(), price=None, start=1):
+        """
+        Declarative description of a long only strategy.
+
+        Parameters:
+        entry : score expressions, summed to get the entry score
+        entry_threshold : minimum entry score to enter a trade
+        exits : exit expressions, conditions if exit_threshold is None (any of them exits), else scores
+        exit_threshold : minimum exit score to exit a trade, None to exit on any exit condition
+        stop_loss_pct : stop loss (0.05 = 5%), None for no stop loss
+        take_profit_pct : take profit (0.1 = 10%), None for no take profit
+        stop_loss_points : exit score added when the stop loss is hit (only with exit_threshold)
+        take_profit_points : exit score added when the take profit is hit (only with exit_threshold)
+        exit_reasons : (name, condition) pairs, a 0/1 column per name flags the exit reason
+                       (checked after stop loss and take profit, in order)
+        columns : (name, expression) pairs added to the signals
+        entry_columns : (name, expression) pairs added to the signals only on entry bars (0 elsewhere)
+        indicators : functions data -> pd.DataFrame, their columns can be used with col()
+        price : price expression, default col('Close')
+        start : first bar where a trade can happen, default 1
+        """
+        self.entry = tuple(entry)
+        self.entry_threshold = entry_threshold
+        self.exits = tuple(exits)
+        self.exit_threshold = exit_threshold
+        self.stop_loss_pct = stop_loss_pct
+        self.take_profit_pct = take_profit_pct
+        self.stop_loss_points = stop_loss_points
+        self.take_profit_points = take_profit_points
+        self.exit_reasons = tuple(exit_reasons)
+        self.columns = tuple(columns)
+        self.entry_columns = tuple(entry_columns)
+        self.indicators = tuple(indicators)
+        self.price = price if price is not None else col("Close")
+        self.start = start
+
+    def prepare(self, data):
+        """Data joined with the indicator columns"""
+        frames = [data] + [indicator(data) for indicator in self.indicators]
+        if len(frames) == 1:
+            return data
+        return pd.concat(frames, axis=1)
+
+
+class CompiledRules:
+    def __init__(self, spec):
+        """
+        Flat program for a RuleSpec, every distinct sub-expression is a single step
+
+        Parameters:
+        spec : RuleSpec to compile
+        """
+        self.spec = spec
+        self.steps = []
+        self.keys = []
+        self._index = {}
+
+        self.price = self._add(spec.price)
+        self.entry_score = self._add(_sum(spec.entry))
+
+        if spec.exit_threshold is None:
+            # Any exit condition exits, same as an exit score of 1 per condition with a threshold of 1
+            exit_any = _any(spec.exits)
+            self.exit_score = self._add(where(exit_any, 1, 0)) if exit_any is not None else None
+            self.exit_threshold = 1
+            self.stop_loss_points = 1
+            self.take_profit_points = 1
+        else:
+            self.exit_score = self._add(_sum(spec.exits)) if spec.exits else None
+            self.exit_threshold = spec.exit_threshold
+            self.stop_loss_points = spec.stop_loss_points
+            self.take_profit_points = spec.take_profit_points
+
+        self.exit_reasons = [(name, self._add(cond)) for name, cond in spec.exit_reasons]
+        self.columns = [(name, self._add(expr)) for name, expr in spec.columns]
+        self.entry_columns = [(name, self._add(expr)) for name, expr in spec.entry_columns]
+
+    def _add(self, expr):
+        # Post order, children are always computed before their parent
+        if expr.key in self._index:
+            return self._index[expr.key]
+        children = [self._add(child) for child in expr.children]
+        self.steps.append((expr.op, children, expr.params))
+        self.keys.append(expr.key)
+        self._index[expr.key] = len(self.steps) - 1
+        return self._index[expr.key]
+
+    def evaluate(self, frame, known=None):
+        """
+        Run the program over a DataFrame
+
+        Parameters:
+        frame : pd.DataFrame with the columns used by the rules
+        known : optional dict expression key -> values already computed on the same frame,
+                the new values are added to it
+
+        Returns:
+        list: one np.ndarray (length of frame) per step
+        """
+        n = len(frame)
+        values = []
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for (op, children, params), key in zip(self.steps, self.keys):
+                if known is not None and key in known:
+                    values.append(known[key])
+                    continue
+                args = [values[c] for c in children]
+                values.append(np.broadcast_to(_OPS[op](frame, args, params), (n,)))
+                if known is not None:
+                    known[key] = values[-1]
+        return values
+
+    def run(self, data, start=None, in_position=False, entry_price=0, cache=None):
+        """
+        Compute the signals for data
+
+        Parameters:
+        data : pd.DataFrame with the columns used by the rules
+        start : first bar where a trade can happen, default the start of the spec
+        in_position / entry_price : position at start, to carry on from a previous run
+        cache : optional RuleCache built on the same data, shared between specs (ValueError for other data)
+
+        Returns:
+        pd.DataFrame: A DataFrame containing:
+            - 'price': the price
+            - the spec columns
+            - 'signal': 1 for buy, 0 for hold, -1 for sell
+            - 'stop_loss': 1 if trade exit by stop loss, else 0
+            - 'take_profit': 1 if trade exit by take profit, else 0
+            - a 0/1 column per exit reason
+            - the spec entry columns
+        """
+        spec = self.spec
+        if cache is not None:
+            frame, known = cache.prepare(spec, data)
+        else:
+            frame, known = spec.prepare(data), None
+        values = self.evaluate(frame, known)
+
+        price = values[self.price].astype(float)
+        entry = values[self.entry_score] >= spec.entry_threshold
+        exit_score = values[self.exit_score] if self.exit_score is not None else np.zeros(len(frame))
+
+        signal, stop_loss, take_profit = position_kernel(
+            price, entry, exit_score, self.exit_threshold,
+            stop_loss_pct=spec.stop_loss_pct,
+            take_profit_pct=spec.take_profit_pct,
+            stop_loss_points=self.stop_loss_points,
+            take_profit_points=self.take_profit_points,
+            start=spec.start if start is None else start,
+            in_position=in_position,
+            entry_price=entry_price
+        )
+
+        signals = pd.DataFrame(index=data.index)
+        signals["price"] = price
+        for name, step in self.columns:
+            signals[name] = values[step]
+        signals["signal"] = signal
+        signals["stop_loss"] = stop_loss
+        signals["take_profit"] = take_profit
+
+        # The first matching reason after stop loss and take profit
+        unexplained = (signal == -1) & (stop_loss == 0) & (take_profit == 0)
+        for name, step in self.exit_reasons:
+            flag = unexplained & values[step].astype(bool)
+            signals[name] = flag.astype(int)
+            unexplained &= ~flag
+
+        for name, step in self.entry_columns:
+            signals[name] = np.where(signal == 1, values[step], 0)
+
+        return signals
+
+
+class RuleCache:
+    def __init__(self, data):
+        """
+        Intermediates shared by every spec run on the same data: the data joined with the indicators
+        and the values of the sub-expressions, e.g. a moving average computed once for many parameter sets
+
+        Parameters:
+        data : pd.DataFrame the specs are run on
+        """
+        self.data = data
+        self.frames = {}
+        self.values = {}
+
+    def prepare(self, spec, data=None):
+        """
+        Parameters:
+        spec : RuleSpec
+        data : data the spec is run on, checked against the data of the cache
+
+        Returns:
+        tuple: (frame, known values) for the indicators of the spec
+        """
+        if data is not None and data is not self.data and not data.equals(self.data):
+            raise ValueError("The RuleCache was built on different data, build a RuleCache for this data")
+        key = tuple(_indicator_key(indicator) for indicator in spec.indicators)
+        if key not in self.frames:
+            self.frames[key] = spec.prepare(self.data)
+            self.values[key] = {}
+        return self.frames[key], self.values[key]
+
+
+def _indicator_key(indicator):
+    # partial(f, x=1) objects are different every time, compare what they call instead
+    if isinstance(indicator, partial):
+        return (indicator.func, indicator.args, tuple(sorted(indicator.keywords.items())))
+    return indicator
+
+
+def compile_rules(spec):
+    return CompiledRules(spec)
+
+
+def position_kernel(price, entry, exit_score, exit_threshold, stop_loss_pct=None, take_profit_pct=None,
+                    stop_loss_points=1, take_profit_points=1, start=1, in_position=False, entry_price=0):
+    """
+    Walk the bars once and follow the position
+
+    Parameters:
+    price : np.ndarray of prices
+    entry : np.ndarray of bool, True where a trade can be entered
+    exit_score : np.ndarray, exit score that doesn't depend on the entry price
+    exit_threshold : minimum exit score to exit a trade
+    stop_loss_pct / take_profit_pct : None to disable
+    stop_loss_points / take_profit_points : score added when the stop loss / take profit is hit
+    start : first bar where a trade can happen
+    in_position / entry_price : position before start, to carry on from a previous run
+
+    Returns:
+    tuple: (signal, stop_loss, take_profit) np.ndarray of int
+    """
+    n = len(price)
+    signal = np.zeros(n, dtype=int)
+    stop_loss = np.zeros(n, dtype=int)
+    take_profit = np.zeros(n, dtype=int)
+
+    # Python scalars are a lot faster than NumPy ones in a loop
+    prices = price.tolist()
+    entries = entry.tolist()
+    exit_scores = exit_score.tolist()
+
+    for i in range(start, n):
+        if not in_position:
+            if entries[i]:
+                signal[i] = 1
+                entry_price = prices[i]
+                in_position = True
+        else:
+            price_change = (prices[i] - entry_price) / entry_price
+            hit_stop = stop_loss_pct is not None and price_change <= -stop_loss_pct
+            hit_take = take_profit_pct is not None and price_change >= take_profit_pct
+
+            score = exit_scores[i]
+            if hit_stop:
+                score += stop_loss_points
+            if hit_take:
+                score += take_profit_points
+
+            if score >= exit_threshold:
+                if hit_stop:
+                    stop_loss[i] = 1
+                elif hit_take:
+                    take_profit[i] = 1
+                signal[i] = -1
+                in_position = False
+                entry_price = 0
+
+    return signal, stop_loss, take_profit
+
+
+def _sum(exprs):
+    exprs = list(exprs)
+    if not exprs:
+        return const(0)
+    total = exprs[0]
+    for expr in exprs[1:]:
+        total = total + expr
+    return total
+
+
+def _any(exprs):
+    exprs = list(exprs)
+    if not exprs:
+        return None
+    result = exprs[0]
+    for expr in exprs[1:]:
+        result = result | expr
+    return result
+
+
+def _shift(values, periods, fill):
+    values = np.asarray(values)
+    n = len(values)
+    periods = min(periods, n)
+    head = np.full(periods, fill)
+    return np.concatenate([head, values[:n - periods]])
+
+
+def _select(args):
+    conds = [np.asarray(c, dtype=bool) for c in args[:-1:2]]
+    choices = list(args[1:-1:2])
+    return np.select(conds, choices, default=args[-1])
+
+
+_OPS = {
+    "col": lambda frame, args, params: frame[params[0]].to_numpy(),
+    "const": lambda frame, args, params: np.asarray(params[0]),
+    "add": lambda frame, args, params: args[0] + args[1],
+    "sub": lambda frame, args, params: args[0] - args[1],
+    "mul": lambda frame, args, params: args[0] * args[1],
+    "div": lambda frame, args, params: args[0] / args[1],
+    "gt": lambda frame, args, params: np.asarray(args[0] > args[1], dtype=bool),
+    "ge": lambda frame, args, params: np.asarray(args[0] >= args[1], dtype=bool),
+    "lt": lambda frame, args, params: np.asarray(args[0] < args[1], dtype=bool),
+    "le": lambda frame, args, params: np.asarray(args[0] <= args[1], dtype=bool),
+    "eq": lambda frame, args, params: np.asarray(args[0] == args[1], dtype=bool),
+    "ne": lambda frame, args, params: np.asarray(args[0] != args[1], dtype=bool),
+    "and": lambda frame, args, params: np.logical_and(args[0], args[1]),
+    "or": lambda frame, args, params: np.logical_or(args[0], args[1]),
+    "not": lambda frame, args, params: np.logical_not(args[0]),
+    "isnull": lambda frame, args, params: pd.isna(args[0]),
+    "where": lambda frame, args, params: np.where(args[0], args[1], args[2]),
+    "select": lambda frame, args, params: _select(args),
+    "rolling_mean": lambda frame, args, params: pd.Series(args[0]).rolling(window=params[0]).mean().to_numpy(),
+    "shift": lambda frame, args, params: _shift(args[0], params[0], params[1]),
+}
@@ -0,0 +1,216 @@
+"""
+Parameter sensitivity of the grid search results.
+
+ResultCube puts the results in N-dimensional arrays indexed by the parameter values, the marginal and
+pairwise sensitivities are then reductions over the other axes.
+refine re-runs only the combinations around the optimum, with the indicators shared between them.
+"""
+import itertools
+import warnings
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from backtest import Backtest
+from grid_search import PARAM_KEYS, build_strategy, summarise_metrics
+from metrics import PerformanceMetrics
+from rules import RuleCache
+from strategies.rule_strategy import RuleStrategy
+
+METRIC_COLUMNS = ['total_return', 'sharpe_ratio', 'max_drawdown', 'total_trades', 'win_rate', 'expectancy',
+                  'composite_score']
+
+REDUCTIONS = {
+    'mean': np.nanmean,
+    'median': np.nanmedian,
+    'max': np.nanmax,
+    'min': np.nanmin,
+    'std': np.nanstd
+}
+
+# Parameters used as bar counts, the other ones (thresholds, percentages) can take any value
+INTEGER_PARAMS = ['short_window', 'long_window', 'volume_ma_period']
+
+
+class ResultCube:
+    def __init__(self, results, param_keys=None, metrics=('composite_score', 'sharpe_ratio', 'max_drawdown')):
+        """
+        Grid search results as N-dimensional arrays, one axis per parameter
+
+        Parameters:
+        results : pd.DataFrame from grid_search (or the saved csv)
+        param_keys : parameter columns in the order of the grid, default every column that is not a metric
+        metrics : metric columns to build a cube for
+        """
+        if param_keys is None:
+            param_keys = [c for c in results.columns if c not in METRIC_COLUMNS and not str(c).startswith('Unnamed')]
+        self.param_keys = list(param_keys)
+        self.metrics = list(metrics)
+
+        # Position of every row on every axis
+        codes = []
+        self.axes = {}
+        for key in self.param_keys:
+            code, values = pd.factorize(results[key], sort=True)
+            codes.append(code)
+            self.axes[key] = np.asarray(values)
+        self.shape = tuple(len(self.axes[key]) for key in self.param_keys)
+        flat = np.ravel_multi_index(codes, self.shape)
+
+        # Missing combinations (e.g. short_window >= long_window) are nan, duplicates are averaged
+        counts = np.bincount(flat, minlength=int(np.prod(self.shape)))
+        self.cubes = {}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for metric in self.metrics:
+                values = results[metric].to_numpy(dtype=float)
+                sums = np.bincount(flat, weights=values, minlength=len(counts))
+                self.cubes[metric] = (sums / np.where(counts > 0, counts, np.nan)).reshape(self.shape)
+
+    def _reduce(self, metric, keep, how):
+        axes = tuple(i for i, key in enumerate(self.param_keys) if key not in keep)
+        with warnings.catch_warnings():
+            # All nan slices are expected for the invalid combinations
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            return REDUCTIONS[how](self.cubes[metric], axis=axes) if axes else self.cubes[metric]
+
+    def marginal(self, param, metric='composite_score', how='mean'):
+        """
+        Metric against one parameter, reduced over all the others
+
+        Parameters:
+        param : parameter name
+        metric : metric name
+        how : 'mean', 'median', 'max', 'min' or 'std'
+
+        Returns:
+        pd.Series: indexed by the parameter values
+        """
+        return pd.Series(self._reduce(metric, [param], how), index=self.axes[param], name=metric).rename_axis(param)
+
+    def pairwise(self, param_a, param_b, metric='composite_score', how='mean'):
+        """
+        Metric against a pair of parameters, reduced over all the others
+
+        Returns:
+        pd.DataFrame: param_a values as index, param_b values as columns
+        """
+        values = self._reduce(metric, [param_a, param_b], how)
+        if self.param_keys.index(param_a) > self.param_keys.index(param_b):
+            values = values.T
+        return pd.DataFrame(values, index=pd.Index(self.axes[param_a], name=param_a),
+                            columns=pd.Index(self.axes[param_b], name=param_b))
+
+    def all_pairwise(self, metric='composite_score', how='mean'):
+        """Every pair of parameters, dict (param_a, param_b) -> pd.DataFrame"""
+        return {(a, b): self.pairwise(a, b, metric, how) for a, b in itertools.combinations(self.param_keys, 2)}
+
+    def sensitivity(self, metric='composite_score', how='mean'):
+        """
+        How much the metric moves with every parameter (range of its marginal)
+
+        Returns:
+        pd.Series: sorted from the most to the least sensitive parameter
+        """
+        spread = {}
+        for key in self.param_keys:
+            marginal = self.marginal(key, metric, how).to_numpy()
+            spread[key] = np.nanmax(marginal) - np.nanmin(marginal)
+        return pd.Series(spread, name=metric).sort_values(ascending=False)
+
+    def optimum(self, metric='composite_score'):
+        """Parameters of the best combination, dict param -> value"""
+        index = np.unravel_index(np.nanargmax(self.cubes[metric]), self.shape)
+        return {key: self.axes[key][i].item() for key, i in zip(self.param_keys, index)}
+
+    def neighbours(self, params, points=1):
+        """
+        Values to test around params, for every parameter: the grid values on each side of it
+        and points values evenly spaced between it and each of them
+
+        Returns:
+        dict: param -> sorted list of values
+        """
+        values = {}
+        for key in self.param_keys:
+            axis = self.axes[key]
+            i = int(np.searchsorted(axis, params[key]))
+            low, high = axis[max(i - 1, 0)], axis[min(i + 1, len(axis) - 1)]
+            # Each side separately, the grid is not always evenly spaced
+            dense = np.concatenate([np.linspace(low, params[key], points + 2),
+                                    np.linspace(params[key], high, points + 2)])
+            if key in INTEGER_PARAMS:
+                dense = np.round(dense).astype(int)
+            else:
+                dense = np.round(dense, 10)
+            values[key] = sorted(set(dense.tolist()) | {params[key]})
+        return values
+
+
+def run_cached_backtest(params, data, param_keys, cache):
+    """Same as grid_search.run_single_backtest, with the indicators shared through the cache"""
+    strategy = build_strategy(params)
+    if strategy is None:
+        return None
+
+    bt = Backtest(data, RuleStrategy(strategy.rule_spec(), cache=cache))
+    results = bt.run()
+
+    metrics = PerformanceMetrics(results=results, trades_df=bt.trade_history_df)
+    return summarise_metrics(params, param_keys, metrics.all_metrics(), has_trades=not bt.trade_history_df.empty)
+
+
+def refine(cube, data, params=None, points=1, metric='composite_score'):
+    """
+    Re-run a denser grid around the optimum of the cube, only for the given parameters
+    (the others stay at the optimum)
+
+    Parameters:
+    cube : ResultCube of the grid search, with every parameter of grid_search.PARAM_KEYS
+    data : Market data the grid search was run on
+    params : parameters to refine, default the two most sensitive ones
+    points : values added between the optimum and each neighbour
+    metric : metric of the optimum
+
+    Returns:
+    pd.DataFrame: Results of the new combinations, sorted by composite score
+    """
+    missing = [key for key in PARAM_KEYS if key not in cube.param_keys]
+    if missing:
+        raise ValueError(f"The cube is missing the parameters {missing}, every parameter is needed to re-run")
+
+    best = cube.optimum(metric)
+    if params is None:
+        params = list(cube.sensitivity(metric).index[:2])
+
+    dense = cube.neighbours(best, points)
+    # Combinations in the order build_strategy expects, whatever the column order of the results
+    values = [dense[key] if key in params else [best[key]] for key in PARAM_KEYS]
+
+    # Every combination runs on the same data so the indicators are only computed once
+    cache = RuleCache(data)
+    results = [run_cached_backtest(combination, data, PARAM_KEYS, cache)
+               for combination in itertools.product(*values)]
+    results_df = pd.DataFrame([r for r in results if r is not None])
+
+    if results_df.empty:
+        return pd.DataFrame()
+
+    return results_df.sort_values('composite_score', ascending=False)
+
+
+def plot_pairwise(cube, param_a, param_b, metric='composite_score', how='mean'):
+    """Heatmap of the metric against a pair of parameters"""
+    table = cube.pairwise(param_a, param_b, metric, how)
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    image = ax.imshow(table.to_numpy(), origin="lower", aspect="auto", cmap="viridis")
+    ax.set_xticks(range(len(table.columns)))
+    ax.set_xticklabels(table.columns)
+    ax.set_yticks(range(len(table.index)))
+    ax.set_yticklabels(table.index)
+    ax.set_xlabel(param_b)
+    ax.set_ylabel(param_a)
+    ax.set_title(f"{metric} ({how}) by {param_a} and {param_b}")
+    fig.colorbar(image, ax=ax, label=metric)
+    return fig
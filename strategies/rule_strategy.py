@@ -0,0 +1,34 @@
+from rules import compile_rules
+
+
+class RuleStrategy:
+    def __init__(self, spec, cache=None):
+        """
+        Strategy built from a declarative RuleSpec, the rules are compiled once and
+        every backtest then runs vectorized with a single pass for the position.
+
+        Parameters:
+        spec : RuleSpec, for example Strategy(...).rule_spec() from strategies.strategy1
+        cache : optional rules.RuleCache of the data, to share the indicators between strategies
+        """
+        self.spec = spec
+        self.cache = cache
+        self.compiled = compile_rules(spec)
+
+    def generate_signals(self, data):
+        """
+        Generate trading signals from the rules
+
+        Parameters:
+        data (pd.DataFrame): A DataFrame with a DateTime index and the columns used by the rules
+            (usually 'Close', 'High', 'Low', 'Volume')
+
+        Returns:
+        pd.DataFrame: A DataFrame containing:
+            - 'price': the original closing prices
+            - 'signal': binary signals (1 for buy, 0 for hold, -1 for sell)
+            - 'stop_loss': 1 if trade exit by stop loss, else 0
+            - 'take_profit': 1 if trade exit by take profit, else 0
+            - a column per exit reason and the extra columns of the spec
+        """
+        return self.compiled.run(data, cache=self.cache)
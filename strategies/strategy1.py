@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
+from functools import partial
 from indicators import calculate_trend_indicators
+from rules import RuleSpec, col, rolling_mean, shift, isnull, where, select, score
 
 class Strategy:
     def __init__(self, short_window=10, long_window=30, adx_threshold=20, trend_direction_threshold=5, stop_loss_pct=0.05, 
@@ -208,4 +210,64 @@ class Strategy:
 
         signals.drop(columns=["raw_signal", "short_ma", "long_ma"], inplace=True)
 
-        return signals
\ No newline at end of file
+        return signals
+
+    def rule_spec(self, scored_exit=False):
+        """
+        Same strategy as a declarative RuleSpec, gives the same signals as generate_signals
+        when run with strategies.rule_strategy.RuleStrategy
+
+        Parameters:
+        scored_exit : use calculate_exit_score and exit_trade_theshold to exit instead of the exit conditions
+
+        Returns:
+        RuleSpec: the entry / exit rules of the strategy
+        """
+        price = col("Close")
+        short_ma = rolling_mean(price, self.short_window)
+        long_ma = rolling_mean(price, self.long_window)
+        adx = col("ADX")
+        trend_direction = col("trend_direction")
+
+        # Volume score, 0 when the volume average is not available yet
+        volume_ma = rolling_mean(col("Volume"), self.volume_ma_period)
+        volume_ratio = where(volume_ma > 0, col("Volume") / volume_ma, 0)
+        volume_score = select(
+            (isnull(volume_ma), 0),
+            (volume_ratio >= self.volume_threshold, 1),
+            (volume_ratio >= 1.0, .5)
+        )
+
+        entry = (
+            select((adx > self.adx_threshold, 2), (adx > (self.adx_threshold * 0.8), 1)),
+            select((trend_direction == 'bullish', 2), (trend_direction == 'neutral', 0.5)),
+            score(shift(short_ma > long_ma, 1, fill=False), 2),
+            volume_score
+        )
+
+        if scored_exit:
+            exit_rules = (score(short_ma < long_ma, 2), score(trend_direction == 'bearish', 1.5))
+            exit_threshold = self.exit_trade_theshold
+        else:
+            exit_rules = (short_ma < long_ma, trend_direction == 'bearish')
+            exit_threshold = None
+
+        return RuleSpec(
+            entry=entry,
+            entry_threshold=self.enter_trade_threshold,
+            exits=exit_rules,
+            exit_threshold=exit_threshold,
+            stop_loss_pct=self.stop_loss_pct,
+            take_profit_pct=self.take_profit_pct,
+            stop_loss_points=4,
+            take_profit_points=3,
+            exit_reasons=(("bearish", trend_direction == 'bearish'),),
+            columns=(
+                ("volume", col("Volume")),
+                ("volume_ma", volume_ma),
+                ("volume_ratio", col("Volume") / volume_ma),
+                ("volume_score", volume_score)
+            ),
+            entry_columns=(("volume_signal", volume_score),),
+            indicators=(partial(calculate_trend_indicators, trend_direction_threshold=self.trend_direction_threshold),)
+        )
@@ -0,0 +1,302 @@
+"""
+Streaming versions of the PerformanceMetrics, every update is O(1) so a live or replayed run can be
+monitored bar by bar without recomputing the whole history.
+At the end of a run they agree with the batch values of PerformanceMetrics.
+"""
+import math
+from collections import deque
+
+import numpy as np
+
+
+class RunningReturn:
+    def __init__(self):
+        self.start_value = None
+        self.value = None
+
+    def update(self, value):
+        if self.start_value is None:
+            self.start_value = value
+        self.value = value
+        return self.total_return()
+
+    def total_return(self):
+        if self.start_value is None:
+            return 0
+        return (self.value - self.start_value) / self.start_value
+
+
+class RunningSharpe:
+    def __init__(self, risk_free_rate=0.01, periods=252):
+        """
+        Sharpe ratio and volatility of the returns, using Welford's online variance
+
+        Parameters:
+        risk_free_rate : yearly risk free rate, default 0.01
+        periods : periods in a year, default 252
+        """
+        self.risk_free_rate = risk_free_rate
+        self.periods = periods
+        self.previous_value = None
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.
+
+    def update(self, value):
+        if self.previous_value is not None:
+            self.add_return(value / self.previous_value - 1)
+        self.previous_value = value
+        return self.sharpe_ratio()
+
+    def add_return(self, daily_return):
+        self.count += 1
+        delta = daily_return - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (daily_return - self.mean)
+
+    def std(self):
+        # Sample standard deviation like pandas, nan with less than 2 returns
+        if self.count < 2:
+            return np.nan
+        return math.sqrt(max(self.m2, 0.) / (self.count - 1))
+
+    def sharpe_ratio(self):
+        # The excess returns have the same standard deviation as the returns
+        excess_mean = self.mean - self.risk_free_rate / self.periods
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.float64(excess_mean) / np.float64(self.std()) * math.sqrt(self.periods)
+
+    def volatility(self):
+        return self.std() * math.sqrt(self.periods)
+
+
+class RollingSharpe(RunningSharpe):
+    def __init__(self, window, risk_free_rate=0.01, periods=252):
+        """
+        Sharpe ratio and volatility over the last window returns
+
+        Parameters:
+        window : number of returns kept
+        """
+        super().__init__(risk_free_rate, periods)
+        self.window = window
+        self.returns = deque()
+
+    def add_return(self, daily_return):
+        super().add_return(daily_return)
+        self.returns.append(daily_return)
+        if len(self.returns) > self.window:
+            self.remove_return(self.returns.popleft())
+
+    def remove_return(self, daily_return):
+        # Reverse Welford update
+        if self.count == 1:
+            self.count, self.mean, self.m2 = 0, 0., 0.
+            return
+        self.count -= 1
+        delta = daily_return - self.mean
+        self.mean -= delta / self.count
+        self.m2 -= delta * (daily_return - self.mean)
+
+
+class RunningDrawdown:
+    def __init__(self):
+        self.peak = None
+        self.drawdown = 0.
+        self.max_drawdown = 0.
+
+    def update(self, value):
+        if self.peak is None or value > self.peak:
+            self.peak = value
+        self.drawdown = (value - self.peak) / self.peak
+        # Drawdowns are negative, the max drawdown is the lowest one
+        self.max_drawdown = min(self.max_drawdown, self.drawdown)
+        return self.drawdown
+
+
+class RollingDrawdown:
+    def __init__(self, window):
+        """
+        Drawdown from the peak of the last window values and the max drawdown over the last window bars,
+        monotonic queues make every update amortised O(1)
+
+        Parameters:
+        window : number of bars kept
+        """
+        self.window = window
+        self.count = 0
+        self.peaks = deque()  # (index, value), decreasing values
+        self.drawdowns = deque()  # (index, drawdown), increasing drawdowns
+        self.drawdown = 0.
+        self.max_drawdown = 0.
+
+    def update(self, value):
+        i = self.count
+        self.count += 1
+
+        while self.peaks and self.peaks[-1][1] <= value:
+            self.peaks.pop()
+        self.peaks.append((i, value))
+        if self.peaks[0][0] <= i - self.window:
+            self.peaks.popleft()
+        peak = self.peaks[0][1]
+        self.drawdown = (value - peak) / peak
+
+        while self.drawdowns and self.drawdowns[-1][1] >= self.drawdown:
+            self.drawdowns.pop()
+        self.drawdowns.append((i, self.drawdown))
+        if self.drawdowns[0][0] <= i - self.window:
+            self.drawdowns.popleft()
+        self.max_drawdown = self.drawdowns[0][1]
+
+        return self.drawdown
+
+
+class TradeStats:
+    def __init__(self):
+        """
+        Win rate and expectancy from the trade history records (as in Backtest.trade_history).
+        Like PerformanceMetrics.calculate_trade_metrics, every record counts in total_trades
+        and only the records with a profit_loss (the closed trades) count as wins or losses.
+        """
+        self.total_trades = 0
+        self.winning_trades = 0
+        self.losing_trades = 0
+        self.total_win = 0.
+        self.total_loss = 0.
+        self.by_reason = {}
+
+    def update(self, trade):
+        self.add_record(trade.get('reason'), _profit_loss(trade))
+
+    def add_record(self, reason, profit_loss):
+        self.total_trades += 1
+        if reason is not None:
+            self.by_reason[reason] = self.by_reason.get(reason, 0) + 1
+        if profit_loss is not None:
+            self.add_profit_loss(profit_loss)
+
+    def remove_record(self, reason, profit_loss):
+        self.total_trades -= 1
+        if reason is not None:
+            self.by_reason[reason] -= 1
+            if self.by_reason[reason] == 0:
+                del self.by_reason[reason]
+        if profit_loss is not None:
+            self.remove_profit_loss(profit_loss)
+
+    def add_profit_loss(self, profit_loss):
+        if profit_loss > 0:
+            self.winning_trades += 1
+            self.total_win += profit_loss
+        else:
+            self.losing_trades += 1
+            self.total_loss += profit_loss
+
+    def remove_profit_loss(self, profit_loss):
+        if profit_loss > 0:
+            self.winning_trades -= 1
+            self.total_win -= profit_loss
+        else:
+            self.losing_trades -= 1
+            self.total_loss -= profit_loss
+
+    def win_rate(self):
+        return self.winning_trades / self.total_trades if self.total_trades > 0 else 0
+
+    def avg_win(self):
+        return self.total_win / self.winning_trades if self.winning_trades > 0 else 0
+
+    def avg_loss(self):
+        return self.total_loss / self.losing_trades if self.losing_trades > 0 else 0
+
+    def expectancy(self):
+        win_rate = self.win_rate()
+        return (win_rate * self.avg_win()) - ((1 - win_rate) * abs(self.avg_loss())) if win_rate > 0 else 0
+
+    def trade_metrics(self):
+        closed = self.winning_trades + self.losing_trades
+        total_profit_loss = self.total_win + self.total_loss
+        return {
+            'expectancy': self.expectancy(),
+            'total_trades': self.total_trades,
+            'winning_trades': self.winning_trades,
+            'losing_trades': self.losing_trades,
+            'win_rate': self.win_rate(),
+            'total_profit_loss': total_profit_loss,
+            'avg_profit_loss': total_profit_loss / closed if closed > 0 else np.nan,
+            'avg_win': self.avg_win(),
+            'avg_loss': self.avg_loss(),
+            'by_reason': dict(self.by_reason)
+        }
+
+
+class RollingTradeStats(TradeStats):
+    def __init__(self, window):
+        """
+        Same metrics as TradeStats over the last window trade history records
+
+        Parameters:
+        window : number of records kept
+        """
+        super().__init__()
+        self.window = window
+        self.records = deque()
+
+    def update(self, trade):
+        record = (trade.get('reason'), _profit_loss(trade))
+        self.add_record(*record)
+        self.records.append(record)
+        if len(self.records) > self.window:
+            self.remove_record(*self.records.popleft())
+
+
+def _profit_loss(trade):
+    # None for the records without a profit_loss (the buys) or with a nan one
+    profit_loss = trade.get('profit_loss')
+    if profit_loss is None or profit_loss != profit_loss:
+        return None
+    return profit_loss
+
+
+class StreamingMetrics:
+    def __init__(self, risk_free_rate=0.01, window=None, trade_window=None):
+        """
+        All the streaming metrics together, update() every bar with the portfolio value
+        and update_trade() with every trade record
+
+        Parameters:
+        risk_free_rate : yearly risk free rate, default 0.01
+        window : if set, Sharpe, volatility and drawdown are over the last window bars
+        trade_window : if set, trade metrics are over the last trade_window trade records
+        """
+        self.running_return = RunningReturn()
+        self.sharpe = RunningSharpe(risk_free_rate) if window is None else RollingSharpe(window, risk_free_rate)
+        self.drawdown = RunningDrawdown() if window is None else RollingDrawdown(window)
+        self.trades = TradeStats() if trade_window is None else RollingTradeStats(trade_window)
+        self.has_closed_trades = False
+
+    def update(self, portfolio_value):
+        self.running_return.update(portfolio_value)
+        self.sharpe.update(portfolio_value)
+        self.drawdown.update(portfolio_value)
+
+    def update_trade(self, trade):
+        self.trades.update(trade)
+        # Like PerformanceMetrics, no trade metrics until a trade has a profit_loss
+        if 'profit_loss' in trade:
+            self.has_closed_trades = True
+
+    def all_metrics(self):
+        """Same keys as PerformanceMetrics.all_metrics"""
+        metrics = {
+            'total_return': self.running_return.total_return(),
+            'sharpe_ratio': self.sharpe.sharpe_ratio(),
+            'max_drawdown': self.drawdown.max_drawdown,
+            'volatility': self.sharpe.volatility()
+        }
+
+        if self.has_closed_trades:
+            metrics.update(self.trades.trade_metrics())
+
+        return metrics
@@ -0,0 +1,98 @@
+import itertools
+
+import matplotlib
+matplotlib.use("Agg")
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import Backtest
+from metrics import PerformanceMetrics
+from rules import RuleCache
+from strategies.rule_strategy import RuleStrategy
+from strategies.strategy1 import Strategy
+from streaming_metrics import StreamingMetrics
+
+
+def make_data(n=600, seed=0):
+    """Random walk OHLCV data"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.015, n)))
+    return pd.DataFrame({
+        'Close': close,
+        'High': close * (1 + np.abs(rng.normal(0, 0.01, n))),
+        'Low': close * (1 - np.abs(rng.normal(0, 0.01, n))),
+        'Open': close,
+        'Volume': rng.integers(1_000_000, 5_000_000, n).astype(float)
+    }, index=pd.bdate_range('2015-01-01', periods=n, name='Date'))
+
+
+# short_window, long_window, adx_threshold, trend_direction_threshold, stop_loss_pct, take_profit_pct,
+# enter_trade_threshold, exit_trade_theshold, volume_ma_period, volume_threshold
+PARAMS = list(itertools.islice(itertools.product(
+    [5, 10], [20, 50], [10, 25], [2, 5], [0.01, 0.03], [0.02, 0.05], [3, 5], [6], [5, 20], [1, 1.5]
+), 0, None, 37))
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+@pytest.mark.parametrize("params", PARAMS)
+def test_rule_spec_matches_generate_signals(params, seed):
+    data = make_data(seed=seed)
+    strategy = Strategy(*params)
+
+    expected = strategy.generate_signals(data)
+    signals = RuleStrategy(strategy.rule_spec()).generate_signals(data)
+
+    assert list(signals.columns) == list(expected.columns)
+    for column in expected.columns:
+        np.testing.assert_allclose(signals[column].astype(float), expected[column].astype(float), err_msg=column)
+
+
+
+def test_rule_cache_is_only_used_on_its_data():
+    data = make_data()
+    cache = RuleCache(data)
+    for params in PARAMS:
+        strategy = Strategy(*params)
+        expected = strategy.generate_signals(data)
+        signals = RuleStrategy(strategy.rule_spec(), cache=cache).generate_signals(data)
+        np.testing.assert_allclose(signals['signal'], expected['signal'])
+
+    with pytest.raises(ValueError):
+        RuleStrategy(Strategy(*PARAMS[0]).rule_spec(), cache=cache).generate_signals(make_data(seed=1))
+@pytest.mark.parametrize("params", [PARAMS[0], PARAMS[-1], (5, 20, 90, 2, 0.01, 0.02, 99, 6, 20, 1)])
+def test_streaming_metrics_match_performance_metrics(params):
+    data = make_data()
+    live_metrics = StreamingMetrics()
+    bt = Backtest(data, RuleStrategy(Strategy(*params).rule_spec()), live_metrics=live_metrics)
+    results = bt.run()
+
+    expected = PerformanceMetrics(results, trades_df=bt.trade_history_df).all_metrics()
+    metrics = live_metrics.all_metrics()
+
+    assert metrics.keys() == expected.keys()
+    for key, value in expected.items():
+        if isinstance(value, dict):
+            assert metrics[key] == value
+        else:
+            np.testing.assert_allclose(metrics[key], value, err_msg=key)
+
+
+@pytest.mark.parametrize("trade_window", [10, 10 ** 9])
+def test_rolling_trade_stats_match_performance_metrics(trade_window):
+    data = make_data()
+    live_metrics = StreamingMetrics(trade_window=trade_window)
+    bt = Backtest(data, RuleStrategy(Strategy(*PARAMS[0]).rule_spec()), live_metrics=live_metrics)
+    results = bt.run()
+
+    # Batch trade metrics of the last trade_window records
+    trades = bt.trade_history_df.iloc[-trade_window:]
+    expected = PerformanceMetrics(results, trades_df=trades).calculate_trade_metrics()
+    metrics = live_metrics.trades.trade_metrics()
+
+    for key, value in expected.items():
+        if isinstance(value, dict):
+            assert metrics[key] == value
+        else:
+            np.testing.assert_allclose(metrics[key], value, err_msg=key)
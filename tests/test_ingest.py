@@ -0,0 +1,56 @@
+import pandas as pd
+
+from ingest import CSVProvider, DataStore, update_symbols
+from test_equivalence import make_data
+
+
+def test_append_keeps_the_previous_bars(tmp_path):
+    bars = make_data(30)
+    store = DataStore(str(tmp_path))
+    store.append('X', bars[:10])
+    store.append('X', bars[10:])
+    store.save_index()
+
+    pd.testing.assert_frame_equal(DataStore(str(tmp_path)).load('X'), bars, check_freq=False)
+
+
+def test_update_symbols_only_adds_new_bars(tmp_path):
+    source = tmp_path / "csv"
+    source.mkdir()
+    data = {symbol: make_data(200, seed) for seed, symbol in enumerate(['AAA', 'BBB'])}
+    for symbol, bars in data.items():
+        bars.to_csv(source / f"{symbol.lower()}.csv")
+
+    provider = CSVProvider(str(source))
+    middle = data['AAA'].index[150]
+    first = update_symbols(list(data), provider=provider, store=DataStore(str(tmp_path / "store")), end=middle)
+    second = update_symbols(list(data), provider=provider, store=DataStore(str(tmp_path / "store")), end='2030-01-01')
+
+    assert first == {'AAA': 150, 'BBB': 150}
+    assert second == {'AAA': 50, 'BBB': 50}
+    store = DataStore(str(tmp_path / "store"))
+    for symbol, bars in data.items():
+        pd.testing.assert_frame_equal(store.load(symbol), bars, check_freq=False)
+
+
+def test_split_rebuilds_the_adjusted_history(tmp_path):
+    source = tmp_path / "csv"
+    source.mkdir()
+    bars = make_data(200)
+    bars.assign(Dividends=0., **{'Stock Splits': 0.}).to_csv(source / "aaa.csv")
+
+    provider = CSVProvider(str(source))
+    store = DataStore(str(tmp_path / "store"))
+    update_symbols(['AAA'], provider=provider, store=store, end=bars.index[150])
+
+    # 2 for 1 split on a new bar, the provider now gives the past prices adjusted
+    adjusted = bars.copy()
+    adjusted.iloc[:170, :4] /= 2
+    adjusted.iloc[:170, 4] *= 2
+    splits = pd.Series(0., index=bars.index)
+    splits.iloc[170] = 2
+    adjusted.assign(Dividends=0., **{'Stock Splits': splits}).to_csv(source / "aaa.csv")
+    added = update_symbols(['AAA'], provider=provider, store=store, end='2030-01-01')
+
+    assert added == {'AAA': 50}
+    pd.testing.assert_frame_equal(store.load('AAA'), adjusted, check_freq=False)